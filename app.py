@@ -5,9 +5,12 @@ Guaranteed sequential ordering using lane labels instead of clusters
 
 import streamlit as st
 import pandas as pd
-import graphviz
-from typing import Dict, Tuple
+import numpy as np
+from typing import Dict, Mapping, Optional, Tuple
+from types import MappingProxyType
 import io
+import shutil
+import hashlib
 
 # Page configuration
 st.set_page_config(
@@ -29,123 +32,276 @@ STEP_CONFIGS = {
     'end': {'shape': 'oval', 'style': 'filled', 'fillcolor': '#FF0000', 'color': 'black', 'fontcolor': 'white', 'penwidth': '2'}
 }
 
+# Freeze the configs so the shared attribute mappings can be handed out without per-call copies
+STEP_CONFIGS = MappingProxyType({step_type: MappingProxyType(attrs) for step_type, attrs in STEP_CONFIGS.items()})
+
+# Edge styles by role: invisible ordering chain, normal flow, and decision Yes/No branches
+EDGE_STYLES = {
+    'order': {'style': 'invis', 'weight': '10'},
+    'flow': {'penwidth': '2', 'arrowhead': 'normal', 'constraint': 'false'},
+    'yes': {'label': 'Yes', 'color': 'green', 'fontcolor': 'green', 'penwidth': '2', 'arrowhead': 'normal', 'constraint': 'false'},
+    'no': {'label': 'No', 'color': 'red', 'fontcolor': 'red', 'penwidth': '2', 'arrowhead': 'normal', 'constraint': 'false'}
+}
+
+# Decision edges keyed by which of (NextStep, YesNext, NoNext) are filled, as (link column, edge role)
+# pairs in emission order. Two data conventions are supported:
+# Convention 1: YesNext and NoNext are filled (standard)
+# Convention 2: NextStep (as Yes) and YesNext (as No) are filled, YesNext being the rejection loop
+DECISION_BRANCHES = {
+    (True, True, True): (('YesNext', 'yes'), ('NoNext', 'no')),
+    (False, True, True): (('YesNext', 'yes'), ('NoNext', 'no')),
+    (True, True, False): (('NextStep', 'yes'), ('YesNext', 'no')),
+    (False, True, False): (('YesNext', 'no'),),
+    # Only NextStep exists for decision - unusual but handle it
+    (True, False, True): (('NextStep', 'yes'),),
+    (True, False, False): (('NextStep', 'yes'),),
+    (False, False, True): (),
+    (False, False, False): (),
+}
+
+# Columns every Flows sheet must provide, in the order they are documented
+REQUIRED_COLUMNS = (
+    'ProcessName', 'ProcessID', 'Lane', 'StepID',
+    'StepOrder', 'StepLabel', 'StepType', 'NextStep',
+    'YesNext', 'NoNext', 'Notes'
+)
+REQUIRED_COLUMN_SET = frozenset(REQUIRED_COLUMNS)
+
+# Subset of the required columns the diagram builders read (ProcessName partitions the sheet)
+FLOW_COLUMNS = [
+    'ProcessName', 'Lane', 'StepID', 'StepOrder', 'StepLabel',
+    'StepType', 'NextStep', 'YesNext', 'NoNext'
+]
+
+# Low-cardinality text columns stored as pandas categoricals after loading
+CATEGORICAL_COLUMNS = ('ProcessName', 'ProcessID', 'Lane', 'StepType')
+
+# Processes longer than these use cheaper edge routing unless splines are set explicitly:
+# polylines above MEDIUM_PROCESS_STEPS, straight lines above LARGE_PROCESS_STEPS
+MEDIUM_PROCESS_STEPS = 50
+LARGE_PROCESS_STEPS = 150
+
+# Cached results expire after this long so a long-running server doesn't hold old uploads indefinitely
+CACHE_TTL = '1h'
+
 def validate_columns(df: pd.DataFrame) -> Tuple[bool, str]:
     """Validate that DataFrame contains all required columns."""
-    required_columns = [
-        'ProcessName', 'ProcessID', 'Lane', 'StepID', 
-        'StepOrder', 'StepLabel', 'StepType', 'NextStep', 
-        'YesNext', 'NoNext', 'Notes'
-    ]
-    
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    # One set difference, then report in the documented column order
+    missing_set = REQUIRED_COLUMN_SET.difference(df.columns)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col in missing_set]
     
     if missing_columns:
         return False, f"Missing required columns: {', '.join(missing_columns)}"
     
     return True, ""
 
-def get_step_attributes(step_type: str) -> Dict[str, str]:
-    """Get visual attributes for a given step type."""
-    step_type_lower = step_type.lower().strip()
-    return STEP_CONFIGS.get(step_type_lower, STEP_CONFIGS['process'])
+def str_column(series: pd.Series) -> pd.Series:
+    """Convert a column to strings in one vectorized pass, with blank cells as '' (categoricals included)."""
+    return series.astype('string').fillna('')
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Store repeated text columns as categoricals and downcast integer step orders to save memory."""
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    if 'StepOrder' in df.columns and pd.api.types.is_integer_dtype(df['StepOrder']):
+        df['StepOrder'] = pd.to_numeric(df['StepOrder'], downcast='integer')
+    
+    return df
+
+def quote_dot(value) -> str:
+    """Quote a value as a DOT string literal (escape sequences such as \\n are kept)."""
+    return '"' + str(value).replace('"', '\\"') + '"'
+
+def format_dot_attrs(attrs: Mapping[str, str]) -> str:
+    """Format an attribute mapping as space-separated DOT key=value pairs."""
+    return ' '.join(f'{key}={quote_dot(value)}' for key, value in attrs.items())
+
+# Node and edge attribute lists are constant, so they are formatted once at import rather than per element
+STEP_ATTR_STRINGS = MappingProxyType({step_type: format_dot_attrs(attrs) for step_type, attrs in STEP_CONFIGS.items()})
+EDGE_ATTR_STRINGS = {role: format_dot_attrs(attrs) for role, attrs in EDGE_STYLES.items()}
 
-def build_flow_for_process(df_proc: pd.DataFrame, process_name: str, orientation: str = 'LR') -> graphviz.Digraph:
-    """Build Graphviz flowchart with guaranteed sequential ordering using lane labels."""
+def build_flow_for_process(df_proc: pd.DataFrame, process_name: str, orientation: str = 'LR',
+                           splines: Optional[str] = None) -> str:
+    """Build Graphviz DOT source with guaranteed sequential ordering using lane labels."""
+    
+    # Orthogonal routing is the slowest Graphviz edge router; bigger processes step down to
+    # polylines and then straight lines
+    if splines is None:
+        if len(df_proc) > LARGE_PROCESS_STEPS:
+            splines = 'line'
+        elif len(df_proc) > MEDIUM_PROCESS_STEPS:
+            splines = 'polyline'
+        else:
+            splines = 'ortho'
+    
+    # DOT is emitted directly as a list of lines and joined once at the end
+    lines = [f'// {process_name}', 'digraph {']
+    
+    # Node IDs and edge endpoints are passed in already quoted
+    def node_line(node: str, label: str, attr_string: str) -> str:
+        return f'\t{node} [label={quote_dot(label)} {attr_string}]'
+    
+    def edge_line(tail: str, head: str, role: str) -> str:
+        return f'\t{tail} -> {head} [{EDGE_ATTR_STRINGS[role]}]'
     
     # Create main graph
-    dot = graphviz.Digraph(comment=process_name, engine='dot')
-    dot.attr(rankdir=orientation, splines='ortho', nodesep='1.0', ranksep='1.8')
-    dot.attr('node', fontname='Arial', fontsize='11', margin='0.3')
-    dot.attr('edge', fontname='Arial', fontsize='10', color='black', penwidth='1.5')
+    lines.append('\t' + format_dot_attrs({'rankdir': orientation, 'splines': splines, 'nodesep': '1.0', 'ranksep': '1.8'}))
+    lines.append('\tnode [' + format_dot_attrs({'fontname': 'Arial', 'fontsize': '11', 'margin': '0.3'}) + ']')
+    lines.append('\tedge [' + format_dot_attrs({'fontname': 'Arial', 'fontsize': '10', 'color': 'black', 'penwidth': '1.5'}) + ']')
     
     # Add process title header
-    dot.attr(label=process_name, labelloc='t', labeljust='l', fontsize='16', fontname='Arial Bold')
+    lines.append('\t' + format_dot_attrs({'label': process_name, 'labelloc': 't', 'labeljust': 'l',
+                                           'fontsize': '16', 'fontname': 'Arial Bold'}))
+    
+    # Nothing to lay out for an empty process: emit just the titled graph
+    if df_proc.empty:
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+    
+    # Sort by StepOrder, skipping the sort when the sheet is already in step order
+    if df_proc['StepOrder'].is_monotonic_increasing:
+        df_sorted = df_proc.reset_index(drop=True)
+    else:
+        df_sorted = df_proc.sort_values('StepOrder').reset_index(drop=True)
+    
+    # Prepare node IDs, types and labels column-wise before the render loop
+    step_ids = str_column(df_sorted['StepID']).tolist()
+    
+    # Each StepID is quoted once and reused for its node, ordering edges, rank group and outgoing edges
+    quoted_ids = [quote_dot(step_id) for step_id in step_ids]
+    step_type_col = str_column(df_sorted['StepType']).str.lower().str.strip()
+    step_types = step_type_col.tolist()
+    
+    # Add lane to the label with clear separation
+    node_labels = ('[' + str_column(df_sorted['Lane']) + ']\\n' + str_column(df_sorted['StepLabel'])).tolist()
+    
+    # Resolve formatted visual attributes once per distinct step type; the types are already
+    # normalized, so they index STEP_ATTR_STRINGS directly
+    default_attrs = STEP_ATTR_STRINGS['process']
+    attrs_by_type = {step_type: STEP_ATTR_STRINGS.get(step_type, default_attrs) for step_type in set(step_types)}
+    
+    # Link targets coerced to plain strings once per column (blank cells become '')
+    link_targets = {col: str_column(df_sorted[col]).to_numpy() for col in ('NextStep', 'YesNext', 'NoNext')}
+    next_steps = link_targets['NextStep']
+    
+    # Vectorized validity masks replace the per-row checks (a literal 'nan' text still means no link)
+    has_next = ~np.isin(next_steps, ['', 'nan'])
+    has_yes = ~np.isin(link_targets['YesNext'], ['', 'nan'])
+    has_no = ~np.isin(link_targets['NoNext'], ['', 'nan'])
+    
+    # Terminal steps (e.g. 'end') have no NextStep/YesNext/NoNext and emit no edges
+    has_link = has_next | has_yes | has_no
+    
+    # Steps sharing a StepOrder are tied by their rank group, so the ordering chain only links
+    # a step to its predecessor when the order advances
+    step_orders = df_sorted['StepOrder'].to_numpy()
+    starts_rank = np.ones(len(step_orders), dtype=bool)
+    starts_rank[1:] = step_orders[1:] != step_orders[:-1]
+    
+    # Decision vs normal edge styling is precomputed from the step types normalized for the nodes
+    is_decision = step_type_col.eq('decision').to_numpy(dtype=bool)
     
-    # Sort by StepOrder
-    df_sorted = df_proc.sort_values('StepOrder').reset_index(drop=True)
+    # Single pass over the steps, buffering nodes, ordering edges and visible edges separately
+    # so they can be flushed in DOT order afterwards
+    node_lines, order_lines, flow_lines = [], [], []
     
-    # Add all nodes with lane information in the label
-    for _, row in df_sorted.iterrows():
-        step_id = str(row['StepID'])
-        step_label = str(row['StepLabel'])
-        lane = str(row['Lane'])
-        step_type = str(row['StepType'])
+    for i, step_id in enumerate(quoted_ids):
+        # Add the node with lane information in the label
+        node_lines.append(node_line(step_id, node_labels[i], attrs_by_type[step_types[i]]))
         
-        # Get attributes for this step type
-        attrs = get_step_attributes(step_type)
+        # Add invisible edge from the previous step to maintain order
+        if i and starts_rank[i]:
+            order_lines.append(edge_line(quoted_ids[i - 1], step_id, 'order'))
         
-        # Add lane to the label with clear separation
-        full_label = f"[{lane}]\\n{step_label}"
+        if not has_link[i]:
+            continue
         
-        # Add the node
-        dot.node(step_id, full_label, **attrs)
+        # Handle decision nodes with Yes/No branches, picked by which link columns are filled
+        if is_decision[i]:
+            for column, role in DECISION_BRANCHES[has_next[i], has_yes[i], has_no[i]]:
+                flow_lines.append(edge_line(step_id, quote_dot(link_targets[column][i]), role))
+        elif has_next[i]:
+            # Normal flow using NextStep
+            flow_lines.append(edge_line(step_id, quote_dot(next_steps[i]), 'flow'))
     
-    # Create rank groups for sequential ordering
-    step_orders = sorted(df_sorted['StepOrder'].unique())
+    lines.extend(node_lines)
     
-    for order in step_orders:
-        steps_at_order = df_sorted[df_sorted['StepOrder'] == order]['StepID'].tolist()
+    # Create rank groups for sequential ordering
+    # (one groupby pass yields each order's row positions into the prepared StepID list)
+    for positions in df_sorted.groupby('StepOrder', sort=True).indices.values():
+        # A lone step already occupies its own rank, so only shared orders need a group
+        if len(positions) < 2:
+            continue
         
         # Force all steps at same order to be at same rank
-        with dot.subgraph() as s:
-            s.attr(rank='same')
-            for step_id in steps_at_order:
-                s.node(str(step_id))
-    
-    # Add edges to enforce sequential flow
-    for i in range(len(df_sorted) - 1):
-        current_step = str(df_sorted.iloc[i]['StepID'])
-        next_step = str(df_sorted.iloc[i+1]['StepID'])
-        
-        # Add invisible edge to maintain order
-        dot.edge(current_step, next_step, style='invis', weight='10')
+        lines.append('\t{')
+        lines.append('\t\trank=same')
+        for i in positions:
+            lines.append(f'\t\t{quoted_ids[i]}')
+        lines.append('\t}')
     
-    # Add visible edges (connections between steps)
-    for _, row in df_sorted.iterrows():
-        step_id = str(row['StepID'])
-        step_type = str(row['StepType']).lower().strip()
-        
-        # Handle decision nodes with Yes/No branches
-        if step_type == 'decision':
-            # Check for YesNext and NoNext first (standard approach)
-            yes_next = str(row['YesNext']) if pd.notna(row['YesNext']) else ''
-            no_next = str(row['NoNext']) if pd.notna(row['NoNext']) else ''
-            next_step = str(row['NextStep']) if pd.notna(row['NextStep']) else ''
-            
-            # Flexible logic: Handle different data conventions
-            # Convention 1: YesNext and NoNext are filled (standard)
-            # Convention 2: NextStep (as Yes) and YesNext (as No) are filled
-            
-            if yes_next and yes_next != 'nan' and yes_next != '':
-                # YesNext is populated - use it
-                if no_next and no_next != 'nan' and no_next != '':
-                    # Both YesNext and NoNext exist (standard convention)
-                    dot.edge(step_id, yes_next, label='Yes', color='green', fontcolor='green', 
-                            penwidth='2', arrowhead='normal', constraint='false')
-                    dot.edge(step_id, no_next, label='No', color='red', fontcolor='red',
-                            penwidth='2', arrowhead='normal', constraint='false')
-                else:
-                    # Only YesNext exists, treat as "No" rejection path (backward loop)
-                    # and NextStep as "Yes" approval path (forward)
-                    if next_step and next_step != 'nan' and next_step != '':
-                        dot.edge(step_id, next_step, label='Yes', color='green', fontcolor='green',
-                                penwidth='2', arrowhead='normal', constraint='false')
-                    dot.edge(step_id, yes_next, label='No', color='red', fontcolor='red',
-                            penwidth='2', arrowhead='normal', constraint='false')
-            elif next_step and next_step != 'nan' and next_step != '':
-                # Only NextStep exists for decision - unusual but handle it
-                dot.edge(step_id, next_step, label='Yes', color='green', fontcolor='green',
-                        penwidth='2', arrowhead='normal', constraint='false')
-        else:
-            # Normal flow using NextStep
-            next_step = str(row['NextStep'])
-            if pd.notna(row['NextStep']) and next_step != 'nan' and next_step != '':
-                dot.edge(step_id, next_step, penwidth='2', arrowhead='normal', constraint='false')
+    lines.extend(order_lines)
+    lines.extend(flow_lines)
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=CACHE_TTL)
+def build_flow_source(df_proc: pd.DataFrame, process_name: str, orientation: str = 'LR',
+                      splines: Optional[str] = None) -> str:
+    """Build the DOT source for a process, cached across Streamlit reruns."""
+    return build_flow_for_process(df_proc, process_name, orientation, splines)
+
+@st.cache_resource
+def graphviz_available() -> bool:
+    """Check once per server process whether the Graphviz 'dot' executable is installed."""
+    return shutil.which('dot') is not None
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=CACHE_TTL)
+def render_png(dot_source: str) -> bytes:
+    """Render DOT source to PNG bytes, cached so reruns don't re-run the Graphviz layout."""
+    # Imported here so reruns that never render a PNG skip loading the package
+    import graphviz
+    return graphviz.Source(dot_source).pipe(format='png')
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def load_excel(_file_bytes: bytes, data_key: str) -> Tuple[pd.DataFrame, str]:
+    """Read the process sheet from an uploaded workbook, cached on the digest of its bytes."""
+    try:
+        # Rust-backed calamine parses .xlsx several times faster than openpyxl (pandas >= 2.2)
+        xl_file = pd.ExcelFile(io.BytesIO(_file_bytes), engine='calamine')
+    except (ImportError, ValueError):
+        xl_file = pd.ExcelFile(io.BytesIO(_file_bytes), engine='openpyxl')
+    sheet_names = xl_file.sheet_names
     
-    return dot
+    # Try to find 'Flows' sheet first, otherwise use first sheet
+    sheet_to_read = 'Flows' if 'Flows' in sheet_names else sheet_names[0]
+    
+    return optimize_dtypes(xl_file.parse(sheet_to_read)), sheet_to_read
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=CACHE_TTL)
+def index_processes(_df: pd.DataFrame, data_key: str) -> Dict[str, np.ndarray]:
+    """Map each ProcessName to its row positions in one groupby pass, cached per dataset."""
+    # The leading underscore keeps Streamlit from hashing the sheet; data_key identifies it instead
+    return _df.groupby('ProcessName', sort=True, observed=True).indices
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=CACHE_TTL)
+def build_excel_export(_df_process: pd.DataFrame, data_key: str, process_name: str) -> bytes:
+    """Serialize process details to an .xlsx workbook, cached per dataset and process."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        _df_process.to_excel(writer, sheet_name='ProcessDetails', index=False)
+    return output.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=CACHE_TTL)
+def build_csv_export(_df_process: pd.DataFrame, data_key: str, process_name: str) -> bytes:
+    """Serialize process details to UTF-8 CSV, cached per dataset and process."""
+    return _df_process.to_csv(index=False).encode('utf-8')
 
+@st.cache_data(show_spinner=False)
 def create_sample_data() -> pd.DataFrame:
-    """Create sample data for demonstration."""
+    """Create sample data for demonstration, built once since it never changes."""
     sample_data = {
         'ProcessName': ['Order Processing'] * 10,
         'ProcessID': ['PROC001'] * 10,
@@ -173,7 +329,7 @@ def create_sample_data() -> pd.DataFrame:
                   'Ship to customer', 'Order complete']
     }
     
-    return pd.DataFrame(sample_data)
+    return optimize_dtypes(pd.DataFrame(sample_data))
 
 def main():
     """Main application function."""
@@ -195,6 +351,13 @@ def main():
             index=0,
             key="layout_orientation"
         )
+        fast_layout = st.checkbox(
+            "Fast layout for large processes",
+            value=True,
+            key="fast_layout",
+            help=(f"Use polyline edges instead of right-angled ones for processes over {MEDIUM_PROCESS_STEPS} steps, "
+                  f"and straight edges over {LARGE_PROCESS_STEPS} steps")
+        )
         
         st.markdown("---")
         
@@ -214,22 +377,26 @@ def main():
 • Notes
         """)
         
-        st.markdown("### Supported Step Types")
-        step_type_info = {
-            'process': ('Process', '#90EE90', 'Standard automated step'),
-            'decision': ('Decision', '#FFD700', 'Yes/No branching'),
-            'manual': ('Manual', '#BA8FD8', 'Manual task'),
-            'predefined': ('Predefined', '#4682B4', 'Subprocess'),
-            'pause': ('Pause', '#FF8C00', 'Wait/delay (dashed)'),
-            'input': ('Input', '#87CEEB', 'Data input'),
-            'output': ('Output', '#87CEEB', 'Data output'),
-            'form': ('Form', '#D3D3D3', 'Form/document (dashed)'),
-            'end': ('End', '#FF0000', 'Process end')
-        }
-        
-        for step_type, (name, color, desc) in step_type_info.items():
-            st.markdown(f"🔹 **{name}**: {desc}")
-            st.markdown(f"<div style='background-color:{color}; height:20px; border: 2px solid black; margin: 5px 0;'></div>", unsafe_allow_html=True)
+        with st.expander("🎨 Supported Step Types", expanded=False):
+            step_type_info = {
+                'process': ('Process', '#90EE90', 'Standard automated step'),
+                'decision': ('Decision', '#FFD700', 'Yes/No branching'),
+                'manual': ('Manual', '#BA8FD8', 'Manual task'),
+                'predefined': ('Predefined', '#4682B4', 'Subprocess'),
+                'pause': ('Pause', '#FF8C00', 'Wait/delay (dashed)'),
+                'input': ('Input', '#87CEEB', 'Data input'),
+                'output': ('Output', '#87CEEB', 'Data output'),
+                'form': ('Form', '#D3D3D3', 'Form/document (dashed)'),
+                'end': ('End', '#FF0000', 'Process end')
+            }
+            
+            # Send the whole legend as one element instead of two per step type
+            legend = "\n\n".join(
+                f"🔹 **{name}**: {desc}\n\n"
+                f"<div style='background-color:{color}; height:20px; border: 2px solid black; margin: 5px 0;'></div>"
+                for name, color, desc in step_type_info.values()
+            )
+            st.markdown(legend, unsafe_allow_html=True)
         
         st.markdown("---")
         st.info("💡 **Note**: This version uses lane labels instead of swimlane boxes to guarantee perfect sequential ordering from Step 1 to final step.")
@@ -248,23 +415,21 @@ def main():
         if st.button("📋 Use Sample Data", use_container_width=True):
             st.session_state['use_sample'] = True
     
-    # Load data
+    # Load data (data_key identifies the loaded dataset, so caches can key on it instead of hashing the sheet)
     df = None
+    data_key = None
     
     if uploaded_file is not None:
         try:
-            # Try to read the first sheet automatically
-            xl_file = pd.ExcelFile(uploaded_file)
-            sheet_names = xl_file.sheet_names
+            # The upload is hashed once here; parsing is cached on that digest, so reruns skip
+            # re-reading the workbook without Streamlit hashing the bytes a second time
+            file_bytes = uploaded_file.getvalue()
+            data_key = hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+            df, sheet_to_read = load_excel(file_bytes, data_key)
             
-            # Try to find 'Flows' sheet first, otherwise use first sheet
-            if 'Flows' in sheet_names:
-                sheet_to_read = 'Flows'
-            else:
-                sheet_to_read = sheet_names[0]
+            if sheet_to_read != 'Flows':
                 st.info(f"ℹ️ Using sheet: '{sheet_to_read}' (no 'Flows' sheet found)")
             
-            df = pd.read_excel(uploaded_file, sheet_name=sheet_to_read)
             st.success(f"✅ File loaded successfully! Found {len(df)} steps from sheet '{sheet_to_read}'")
             st.session_state['use_sample'] = False
         except Exception as e:
@@ -273,6 +438,7 @@ def main():
     
     elif st.session_state.get('use_sample', False):
         df = create_sample_data()
+        data_key = 'sample'
         st.info("📋 Using sample data for demonstration")
     
     # Process the data if available
@@ -284,8 +450,9 @@ def main():
             st.error(f"❌ Invalid file structure: {error_msg}")
             return
         
-        # Get unique processes
-        processes = sorted(df['ProcessName'].unique())
+        # Get unique processes (row positions are partitioned once, so switching processes is a lookup)
+        process_rows = index_processes(df, data_key)
+        processes = sorted(process_rows)
         
         if len(processes) == 0:
             st.warning("⚠️ No processes found in the file")
@@ -300,8 +467,19 @@ def main():
         )
         
         if selected_process:
-            # Filter data for selected process
-            df_process = df[df['ProcessName'] == selected_process].copy()
+            # Filter data for selected process (nothing below mutates it, so no defensive copy)
+            df_process = df.iloc[process_rows[selected_process]]
+            
+            # Step-ordered view shared by the diagram and the details table, sorted at most once
+            # (exports keep the sheet's own row order)
+            if df_process['StepOrder'].is_monotonic_increasing:
+                df_process_sorted = df_process
+            else:
+                try:
+                    df_process_sorted = df_process.sort_values('StepOrder', kind='stable')
+                except TypeError:
+                    # Mixed StepOrder types can't be ordered; keep sheet order and let the diagram report it
+                    df_process_sorted = df_process
             
             # Display process info
             col1, col2, col3 = st.columns(3)
@@ -310,7 +488,9 @@ def main():
             with col2:
                 st.metric("Swimlanes", df_process['Lane'].nunique())
             with col3:
-                process_id = df_process['ProcessID'].iloc[0] if len(df_process) > 0 else "N/A"
+                # First non-blank ProcessID, without scanning for unique values
+                process_id_idx = df_process['ProcessID'].first_valid_index()
+                process_id = df_process.at[process_id_idx, 'ProcessID'] if process_id_idx is not None else "N/A"
                 st.metric("Process ID", process_id)
             
             st.markdown("---")
@@ -321,12 +501,30 @@ def main():
             try:
                 # Determine orientation based on layout selection
                 orientation = 'LR' if 'Horizontal' in st.session_state.get('layout_orientation', 'Horizontal') else 'TB'
+                splines = None if fast_layout else 'ortho'
+                
+                # Sources built this session for the current data and layout, by process name;
+                # reruns and revisits reuse them without re-hashing the process for the cache lookup
+                render_key = (data_key, orientation, splines)
+                last_render = st.session_state.get('last_render')
+                
+                if last_render is None or last_render[0] != render_key:
+                    last_render = (render_key, {})
+                    st.session_state['last_render'] = last_render
                 
-                with st.spinner("Generating diagram..."):
-                    flow_diagram = build_flow_for_process(df_process, selected_process, orientation)
+                flow_sources = last_render[1]
+                dot_source = flow_sources.get(selected_process)
+                
+                if dot_source is None:
+                    with st.spinner("Generating diagram..."):
+                        # Only the selected process is built; only the columns the builder reads are hashed
+                        dot_source = build_flow_source(df_process_sorted[FLOW_COLUMNS], selected_process,
+                                                       orientation, splines)
+                    
+                    flow_sources[selected_process] = dot_source
                 
                 # Display the diagram using Streamlit's built-in renderer (has zoom built-in)
-                st.graphviz_chart(flow_diagram, use_container_width=True)
+                st.graphviz_chart(dot_source, use_container_width=True)
                 
                 st.info("💡 **Tip**: Right-click the diagram and select 'Save image as...' to download, or use the buttons below")
                 
@@ -337,7 +535,6 @@ def main():
                 
                 with col1:
                     # Download DOT source (always works)
-                    dot_source = flow_diagram.source
                     st.download_button(
                         label="📥 Download DOT Source",
                         data=dot_source,
@@ -348,9 +545,16 @@ def main():
                     )
                 
                 with col2:
-                    # Try to render PNG if Graphviz is available
-                    try:
-                        png_data = flow_diagram.pipe(format='png')
+                    # Render PNG only if Graphviz is available (looked up once instead of spawning 'dot' to find out)
+                    png_data = None
+                    if graphviz_available():
+                        try:
+                            png_data = render_png(dot_source)
+                        except Exception:
+                            # Rendering can still fail (e.g. the graphviz package is missing); fall back below
+                            pass
+                    
+                    if png_data is not None:
                         st.download_button(
                             label="📥 Download PNG Image",
                             data=png_data,
@@ -358,7 +562,7 @@ def main():
                             mime="image/png",
                             use_container_width=True
                         )
-                    except Exception as e:
+                    else:
                         st.button(
                             label="📥 PNG (Graphviz Required)",
                             disabled=True,
@@ -402,25 +606,36 @@ def main():
             st.markdown("### 📋 Process Steps Details")
             
             # Display dataframe with formatting
-            display_df = df_process[['StepOrder', 'Lane', 'StepID', 'StepLabel', 'StepType', 'NextStep', 'YesNext', 'NoNext']].copy()
-            display_df = display_df.sort_values('StepOrder')
+            # st.dataframe doesn't mutate its input, so the column selection needs no defensive copy
+            display_df = df_process_sorted[['StepOrder', 'Lane', 'StepID', 'StepLabel', 'StepType', 'NextStep', 'YesNext', 'NoNext']]
             st.dataframe(
                 display_df,
                 use_container_width=True,
                 hide_index=True
             )
             
-            # Export to Excel
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_process.to_excel(writer, sheet_name='ProcessDetails', index=False)
+            # Export to Excel / CSV
+            details_name = f"{selected_process.replace(' ', '_')}_details"
             
-            st.download_button(
-                label="📥 Download Process Details (Excel)",
-                data=output.getvalue(),
-                file_name=f"{selected_process.replace(' ', '_')}_details.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                st.download_button(
+                    label="📥 Download Process Details (Excel)",
+                    data=build_excel_export(df_process, data_key, selected_process),
+                    file_name=f"{details_name}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    use_container_width=True
+                )
+            
+            with col2:
+                st.download_button(
+                    label="📥 Download Process Details (CSV)",
+                    data=build_csv_export(df_process, data_key, selected_process),
+                    file_name=f"{details_name}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
     
     else:
         # Welcome screen